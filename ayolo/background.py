@@ -1,13 +1,18 @@
 import os
 import re
 import math
+import time
+import uuid
 from pathlib import Path
-from typing import List, TypeVar, TYPE_CHECKING
+from typing import List, Optional, TypeVar, TYPE_CHECKING
 
+from . import tracing
+from .locking import FileLock, LeaseManager
 from .constants import COLORS, IMG_EXTENSIONS
 
 if TYPE_CHECKING:
     from .window import Annotator, ImageBrowser, ControlPanel
+    from .proposals import ProposalScheduler
 
 T = TypeVar('T')
 
@@ -21,11 +26,11 @@ class ImageList:
         self.image_annotation_counts = {}
         self.annotations = {}
         self.image_names = []
+        self.dir_entries = {}
 
-        for f in Background.sorted_paths_alphanumeric(self.path.glob("**/*")):
-            if f.name.endswith(IMG_EXTENSIONS):
-                self.image_annotation_counts[f.name] = None
-                self.image_names.append(f.name)
+        for name in Background.sorted_names_alphanumeric(self.scan_dir(self.path)):
+            self.image_annotation_counts[name] = None
+            self.image_names.append(name)
 
         if not os.path.isfile(self.annotation_path):
             with open(self.annotation_path, 'w+') as f:
@@ -38,23 +43,135 @@ class ImageList:
                 self.annotations[img_name] = annotations
                 self.image_annotation_counts[img_name] = len(annotations)
 
+    def scan_dir(self, dir_path: Path, settle: float = 0) -> List[str]:
+        '''List images under `dir_path` recursively, remembering each directory's mtime and contents.
+
+        Images modified less than `settle` seconds ago are left out and their directory is
+        flagged for a rescan, so frames that are still being written are not picked up.
+        '''
+        try:
+            self.dir_entries[dir_path] = self.list_dir(dir_path, settle)
+        except OSError:
+            # Unreadable or vanished directory, retried on the next refresh
+            return []
+        names = list(self.dir_entries[dir_path][1])
+        for subdir in self.dir_entries[dir_path][2]:
+            names.extend(self.scan_dir(subdir, settle))
+        return names
+
+    @staticmethod
+    def list_dir(dir_path: Path, settle: float = 0, known=frozenset()):
+        '''Returns the directory's mtime, image names and subdirectories, the mtime is None
+        when an image not in `known` was modified less than `settle` seconds ago.
+
+        Symlinked directories are not followed, entries that can't be stat'ed are skipped.'''
+        mtime = os.stat(dir_path).st_mtime_ns
+        names, subdirs = set(), []
+        now = time.time()
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(Path(entry.path))
+                    elif entry.name.endswith(IMG_EXTENSIONS):
+                        if settle and entry.name not in known and entry.stat().st_mtime > now - settle:
+                            mtime = None
+                            continue
+                        names.add(entry.name)
+                except OSError:
+                    continue
+        return mtime, names, subdirs
+
+    def forget_dir(self, dir_path: Path) -> List[str]:
+        _, names, subdirs = self.dir_entries.pop(dir_path, (None, set(), []))
+        names = list(names)
+        for subdir in subdirs:
+            names.extend(self.forget_dir(subdir))
+        return names
+
+    @tracing.traced("watch", "io")
+    def refresh(self, settle: float = 1):
+        '''Diff the images on disk against the in-memory index, only rescanning directories whose mtime changed.
+
+        Returns the added and removed image names, both already applied. Annotations of removed
+        images are kept, so an image that is missing for a while comes back with them.
+        '''
+        added, removed = [], []
+        try:
+            os.stat(self.path)
+        except OSError:
+            # Dataset directory unreachable (unmounted share, being moved), try again next poll
+            return added, removed
+        pending = [self.path]
+        while pending:
+            dir_path = pending.pop()
+            mtime, names, subdirs = self.dir_entries.get(dir_path, (None, set(), []))
+            try:
+                if mtime is not None and os.stat(dir_path).st_mtime_ns == mtime:
+                    pending.extend(subdirs)
+                    continue
+                new_mtime, new_names, new_subdirs = self.list_dir(dir_path, settle, names)
+            except OSError:
+                removed.extend(self.forget_dir(dir_path))
+                continue
+            self.dir_entries[dir_path] = (new_mtime, new_names, new_subdirs)
+            added.extend(new_names - names)
+            removed.extend(names - new_names)
+            for subdir in subdirs:
+                if subdir not in new_subdirs:
+                    removed.extend(self.forget_dir(subdir))
+            for subdir in new_subdirs:
+                if subdir in self.dir_entries:
+                    pending.append(subdir)
+                else:
+                    added.extend(self.scan_dir(subdir, settle))
+
+        added = [name for name in added if name not in self.image_names]
+        removed = [name for name in removed if name in self.image_names]
+        for name in removed:
+            self.image_annotation_counts.pop(name, None)
+            self.image_names.remove(name)
+        if added:
+            for name in added:
+                Background.insort_alphanumeric(self.image_names, name)
+            # Keep the dict in the same natural order as image_names, the browser lists follow it
+            counts = dict(self.image_annotation_counts)
+            self.image_annotation_counts.clear()
+            for name in self.image_names:
+                annotations = self.annotations.get(name)
+                self.image_annotation_counts[name] = counts.pop(name, None if annotations is None else len(annotations))
+            self.image_annotation_counts.update(counts)
+        return added, removed
+
     def remove(self, name: str):
         self.image_annotation_counts.pop(name)
         self.annotations.pop(name, None)
         self.image_names.remove(name)
-        os.remove(self.path / name)
+        try:
+            os.remove(self.path / name)
+        except FileNotFoundError:
+            pass
 
     def pop(self, name: str):
-        self.image_annotation_counts[name] = None
+        # Images missing on disk keep their annotations without being listed
+        if name in self.image_annotation_counts:
+            self.image_annotation_counts[name] = None
         self.annotations.pop(name, None)
-        with open(self.annotation_path, 'w') as f:
-            f.writelines([self.annotation_serialize(img_name, boxes) for img_name, boxes in self.annotations.items()])
+        self.dump()
 
     def save(self, name: str, annotations):
-        self.image_annotation_counts[name] = len(annotations)
+        if name in self.image_annotation_counts:
+            self.image_annotation_counts[name] = len(annotations)
         self.annotations[name] = annotations
+        self.dump()
+
+    @tracing.traced("save", "io")
+    def dump(self):
+        content = ''.join(self.annotation_serialize(img_name, boxes) for img_name, boxes in self.annotations.items())
         with open(self.annotation_path, 'w') as f:
-            f.writelines([self.annotation_serialize(img_name, boxes) for img_name, boxes in self.annotations.items()])
+            f.write(content)
+        if tracing.tracer.enabled:
+            tracing.count("bytes_written", len(content.encode()))
 
     @staticmethod
     def annotation_deserialize(line):
@@ -68,6 +185,127 @@ class ImageList:
         return f"{img_path} {' '.join(','.join(str(b) for b in box) for box in boxes)}\n"
 
 
+class SharedImageList(ImageList):
+    '''ImageList for datasets annotated by several ayolo sessions at once.
+
+    Every write happens under an inter-process lock and is also appended to a change
+    journal, sessions catch up by reading the journal from their last offset so only
+    records changed by others are re-read. The journal is started over once it grows past
+    `journal_limit` bytes with a new generation id on its first line, sessions that see a
+    different generation fall back to re-reading the whole file.
+    '''
+
+    journal_limit = 1 << 20
+
+    def __init__(self, path: Path) -> None:
+        self.state_path = path.parent / ".ayolo"
+        self.journal_path = self.state_path / "annotations.journal"
+        self.lock = FileLock(self.state_path / "annotations.lock")
+        with self.lock:
+            super().__init__(path)
+            if not os.path.isfile(self.journal_path) or not os.path.getsize(self.journal_path):
+                self.new_journal()
+            with open(self.journal_path, 'rb') as f:
+                self.journal_generation = f.readline()
+                self.journal_offset = f.seek(0, os.SEEK_END)
+
+    def new_journal(self):
+        tmp_path = self.journal_path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(uuid.uuid4().hex.encode() + b"\n")
+        os.replace(tmp_path, self.journal_path)
+
+    def sync(self):
+        '''Apply changes written by other sessions, returns the names of the changed images'''
+        with self.lock:
+            with open(self.journal_path, 'rb') as f:
+                generation = f.readline()
+                if generation != self.journal_generation:
+                    changed = self.reload()
+                    f.seek(0, os.SEEK_END)
+                else:
+                    changed = set()
+                    f.seek(self.journal_offset)
+                    for line in f.read().decode().splitlines():
+                        changed.add(self.apply_record(line))
+                    changed.discard(None)
+                self.journal_generation, self.journal_offset = generation, f.tell()
+        return changed
+
+    def apply_record(self, line: str):
+        op, _, record = line.strip().partition(' ')
+        if not record:
+            return None
+        if op == 'S':
+            name, annotations = self.annotation_deserialize(record)
+            self.annotations[name] = annotations
+            self.image_annotation_counts[name] = len(annotations)
+        elif op == 'P':
+            name = record
+            self.annotations.pop(name, None)
+            self.image_annotation_counts[name] = None
+        elif op == 'R':
+            name = record
+            self.annotations.pop(name, None)
+            self.image_annotation_counts.pop(name, None)
+            if name in self.image_names:
+                self.image_names.remove(name)
+        else:
+            return None
+        return name
+
+    def reload(self):
+        annotations = {}
+        with open(self.annotation_path, 'r') as f:
+            for line in f.readlines():
+                if not line.strip():
+                    continue
+                img_name, boxes = self.annotation_deserialize(line.strip())
+                annotations[img_name] = boxes
+        changed = set()
+        for name in list(self.image_annotation_counts):
+            if name not in annotations and self.image_annotation_counts[name] is not None:
+                self.apply_record(f"P {name}")
+                changed.add(name)
+        for name, boxes in annotations.items():
+            if self.annotations.get(name) != boxes:
+                self.annotations[name] = boxes
+                self.image_annotation_counts[name] = len(boxes)
+                changed.add(name)
+        return changed
+
+    def journal(self, record: str):
+        with open(self.journal_path, 'ab') as f:
+            f.write(record.encode())
+            self.journal_offset = f.tell()
+        if self.journal_offset > self.journal_limit:
+            self.new_journal()
+            with open(self.journal_path, 'rb') as f:
+                self.journal_generation = f.readline()
+                self.journal_offset = f.tell()
+
+    def remove(self, name: str):
+        with self.lock:
+            self.sync()
+            if name not in self.image_annotation_counts:
+                # Another session removed it first
+                return
+            super().remove(name)
+            self.journal(f"R {name}\n")
+
+    def pop(self, name: str):
+        with self.lock:
+            self.sync()
+            super().pop(name)
+            self.journal(f"P {name}\n")
+
+    def save(self, name: str, annotations):
+        with self.lock:
+            self.sync()
+            super().save(name, annotations)
+            self.journal("S " + self.annotation_serialize(name, annotations))
+
+
 class ClassList(list):
 
     def __init__(self, path: str, *args, **kwargs):
@@ -95,18 +333,45 @@ class Background:
     annotator: 'Annotator'
     control_panel: 'ControlPanel'
     image_browser: 'ImageBrowser'
+    proposals: Optional['ProposalScheduler']
 
-    def __init__(self, dir_path: str) -> None:
+    @tracing.traced("scan", "io")
+    def __init__(self, dir_path: str, shared: bool = False) -> None:
         self.dir_path = Path(dir_path)
-        self.images = ImageList(self.dir_path / "annotations.txt")
+        self.shared = shared
+        if shared:
+            self.images = SharedImageList(self.dir_path / "annotations.txt")
+            self.leases = LeaseManager(self.images.state_path / "leases", self.images.lock)
+        else:
+            self.images = ImageList(self.dir_path / "annotations.txt")
+            self.leases = None
+        self.proposals = None
         self.classes = ClassList(self.dir_path / 'classes.txt')
-        self.img_paths = self.sorted_paths_alphanumeric(f for f in self.dir_path.glob('**/*') if f.name.endswith(('.jpg', '.png')))
 
     @staticmethod
-    def sorted_paths_alphanumeric(data: List[Path]):
+    def alphanumeric_key(name: str):
         convert = lambda text: int(text) if text.isdigit() else text.lower()
-        alphanum_key = lambda key: [convert(c) for c in re.split('([0-9]+)', key.name)] 
-        return sorted(data, key=alphanum_key)
+        return [convert(c) for c in re.split('([0-9]+)', name)]
+
+    @staticmethod
+    def sorted_paths_alphanumeric(data: List[Path]):
+        return sorted(data, key=lambda key: Background.alphanumeric_key(key.name))
+
+    @staticmethod
+    def sorted_names_alphanumeric(data: List[str]):
+        return sorted(data, key=Background.alphanumeric_key)
+
+    @staticmethod
+    def insort_alphanumeric(names: List[str], name: str):
+        key = Background.alphanumeric_key(name)
+        lo, hi = 0, len(names)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if Background.alphanumeric_key(names[mid]) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        names.insert(lo, name)
 
     @classmethod
     def get_color(cls, cls_id, clas_len, format="rgb"):
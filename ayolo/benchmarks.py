@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import random
+import shutil
+import platform
+import statistics
+import tempfile
+import time
+from itertools import cycle
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .background import Background, ImageList
+
+
+REGRESSION_THRESHOLD = 1.10
+WARMUP = 3
+SEARCH_QUERIES = ("", "class_1", "zzz")
+# Runs that differ in any of these measure different workloads and can't be compared
+COMPARABLE_META = ("qpa_platform", "images", "boxes", "classes", "repeat", "seed", "warmup")
+
+
+def generate_dataset(dir_path: str, images: int = 200, boxes: int = 5, classes: int = 20,
+                     size=(640, 480), seed: int = 0) -> Path:
+    '''Create a synthetic dataset with random images, classes and annotations'''
+    from PyQt5 import QtGui
+
+    rng = random.Random(seed)
+    dir_path = Path(dir_path)
+    dir_path.mkdir(parents=True, exist_ok=True)
+    width, height = size
+
+    with open(dir_path / 'classes.txt', 'w') as f:
+        for i in range(classes):
+            f.write(f"class_{i}\n")
+
+    # Decoding cost depends on content, so every image is a different noisy canvas
+    template = QtGui.QImage(width, height, QtGui.QImage.Format.Format_RGB32)
+    lines = []
+    for i in range(images):
+        name = f"img_{i}.png"
+        template.fill(QtGui.QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        painter = QtGui.QPainter(template)
+        for _ in range(16):
+            painter.fillRect(rng.randrange(width), rng.randrange(height), rng.randrange(1, width // 2), rng.randrange(1, height // 2),
+                             QtGui.QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        painter.end()
+        template.save(str(dir_path / name))
+        # Keep roughly half of the images unannotated so both browser lists are populated
+        if i % 2:
+            continue
+        anns = []
+        for _ in range(boxes):
+            x1, x2 = sorted((rng.randrange(width), rng.randrange(width)))
+            y1, y2 = sorted((rng.randrange(height), rng.randrange(height)))
+            anns.append((x1, y1, x2, y2, rng.randrange(classes)))
+        lines.append(ImageList.annotation_serialize(name, anns))
+
+    with open(dir_path / 'annotations.txt', 'w') as f:
+        f.writelines(lines)
+    return dir_path
+
+
+def measure(func: Callable, repeat: int, setup: Optional[Callable] = None, warmup: int = WARMUP) -> Dict[str, float]:
+    '''Time `func` `repeat` times after `warmup` untimed runs, `setup` is called before each run and its return value is passed to `func`'''
+    for _ in range(warmup):
+        func(*(setup() if setup else ()))
+    samples = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "max": max(samples),
+    }
+
+
+def bench_image_list(dir_path: Path, repeat: int) -> Dict[str, dict]:
+    results = {}
+    annotation_path = dir_path / 'annotations.txt'
+    results["ImageList.__init__"] = measure(lambda: ImageList(annotation_path), repeat)
+
+    images = ImageList(annotation_path)
+    results["ImageList.refresh"] = measure(images.refresh, repeat)
+    annotated = [name for name, count in images.image_annotation_counts.items() if count is not None]
+    anns = images.annotations[annotated[0]]
+    names = cycle(annotated)
+    results["ImageList.save"] = measure(lambda: images.save(next(names), anns), repeat)
+
+    names = cycle(annotated)
+
+    def pop_setup():
+        name = next(names)
+        images.annotations[name] = anns
+        return (name,)
+
+    results["ImageList.pop"] = measure(images.pop, repeat, setup=pop_setup)
+
+    # `remove` deletes the image from disk, so each run restores it outside of the timed section
+    victim = images.image_names[-1]
+    victim_bytes = (dir_path / victim).read_bytes()
+
+    def remove_setup():
+        if victim not in images.image_annotation_counts:
+            (dir_path / victim).write_bytes(victim_bytes)
+            images.image_annotation_counts[victim] = None
+            images.image_names.append(victim)
+        return (victim,)
+
+    results["ImageList.remove"] = measure(images.remove, repeat, setup=remove_setup)
+    remove_setup()
+    return results
+
+
+def bench_background(dir_path: Path, repeat: int) -> Dict[str, dict]:
+    return {"Background.__init__": measure(lambda: Background(str(dir_path)), repeat)}
+
+
+def bench_window(dir_path: Path, repeat: int) -> Dict[str, dict]:
+    from PyQt5 import QtWidgets
+    from .window import MainWindow
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    results = {}
+    main = MainWindow(str(dir_path))
+    main.show()
+    app.processEvents()
+
+    browser = main.image_browser
+    results["ImageBrowser.navigate_next"] = measure(browser.navigate_next, repeat)
+    results["ImageBrowser.navigate_prev"] = measure(browser.navigate_prev, repeat)
+
+    panel = main.control_panel
+    for query in SEARCH_QUERIES:
+        results[f"ControlPanel.update_search_results[{query}]"] = measure(lambda: panel.update_search_results(query), repeat)
+    panel.update_search_results("")
+
+    annotator = main.annotator
+    app.processEvents()
+
+    def cold_paint_setup():
+        # Drop the scaled pixmap so every paint decodes and scales the image again
+        annotator.pixmap_cache = None
+        return ()
+
+    results["Annotator.paintEvent[cold]"] = measure(annotator.repaint, repeat, setup=cold_paint_setup)
+    results["Annotator.paintEvent[warm]"] = measure(annotator.repaint, repeat)
+
+    # Skip the exit confirmation dialog
+    main.hide()
+    main.deleteLater()
+    app.processEvents()
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = REGRESSION_THRESHOLD) -> Dict[str, dict]:
+    '''Compare against a baseline, only flagging a regression when both the min and the median got slower'''
+    comparison = {}
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        ratio = current["min"] / baseline[name]["min"] if baseline[name]["min"] else float("inf")
+        median_ratio = current["median"] / baseline[name]["median"] if baseline[name]["median"] else float("inf")
+        comparison[name] = {
+            "baseline": baseline[name]["min"],
+            "current": current["min"],
+            "ratio": ratio,
+            "median_ratio": median_ratio,
+            "regression": ratio > threshold and median_ratio > threshold,
+        }
+    return comparison
+
+
+def meta_mismatches(meta: dict, baseline_meta: dict) -> List[str]:
+    return [key for key in COMPARABLE_META if meta.get(key) != baseline_meta.get(key)]
+
+
+def run(output: Optional[str] = None, baseline: Optional[str] = None, images: int = 200, boxes: int = 5,
+        classes: int = 20, repeat: int = 20, seed: int = 0, suites: Optional[List[str]] = None,
+        threshold: float = REGRESSION_THRESHOLD) -> dict:
+    '''Run the benchmark suite headlessly on a freshly generated dataset and return the report'''
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtCore, QtWidgets
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    all_suites = {
+        "image_list": bench_image_list,
+        "background": bench_background,
+        "window": bench_window,
+    }
+    suites = suites or list(all_suites)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "qt": QtCore.QT_VERSION_STR,
+            "platform": platform.platform(),
+            "qpa_platform": app.platformName(),
+            "images": images,
+            "boxes": boxes,
+            "classes": classes,
+            "repeat": repeat,
+            "seed": seed,
+            "warmup": WARMUP,
+            "threshold": threshold,
+        },
+        "results": {},
+    }
+
+    tmp_dir = tempfile.mkdtemp(prefix="ayolo-bench-")
+    try:
+        dir_path = generate_dataset(tmp_dir, images=images, boxes=boxes, classes=classes, seed=seed)
+        for suite in suites:
+            report["results"].update(all_suites[suite](dir_path, repeat))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if baseline:
+        with open(baseline, 'r') as f:
+            baseline_report = json.load(f)
+        mismatches = meta_mismatches(report["meta"], baseline_report.get("meta", {}))
+        if mismatches:
+            report["comparison_skipped"] = {key: [baseline_report.get("meta", {}).get(key), report["meta"][key]] for key in mismatches}
+        else:
+            report["comparison"] = compare(report["results"], baseline_report["results"], threshold)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = []
+    comparison = report.get("comparison", {})
+    for name, stats in report["results"].items():
+        line = f"{name:<48} median {stats['median'] * 1000:9.3f} ms  min {stats['min'] * 1000:9.3f} ms"
+        if name in comparison:
+            line += f"  x{comparison[name]['ratio']:.2f}"
+            if comparison[name]["regression"]:
+                line += " REGRESSION"
+        lines.append(line)
+    for key, (baseline_value, value) in report.get("comparison_skipped", {}).items():
+        lines.append(f"Baseline not compared, {key} differs: {baseline_value!r} (baseline) != {value!r}")
+    return "\n".join(lines)
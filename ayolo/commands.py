@@ -1,14 +1,34 @@
 import sys
 
+from . import tracing
 from .window import MainWindow
 
 
-def annotate(dir_path):
-    MainWindow.run(dir_path)
+def annotate(dir_path, *options):
+    for option in options:
+        if option != "shared" and not option.startswith("propose="):
+            raise ValueError(f"Unknown annotate option '{option}', expected 'shared' or 'propose=<provider>'")
+    propose = next((option.partition("=")[2] for option in options if option.startswith("propose=")), None)
+    MainWindow.run(dir_path, shared="shared" in options, propose=propose)
+
+
+def benchmark(output="benchmark.json", baseline=None, images="200", boxes="5", classes="20", repeat="20", threshold="1.10"):
+    from .benchmarks import run, format_report
+
+    report = run(output, baseline, images=int(images), boxes=int(boxes), classes=int(classes), repeat=int(repeat),
+                 threshold=float(threshold))
+    print(format_report(report))
+    if any(c["regression"] for c in report.get("comparison", {}).values()):
+        sys.exit(1)
 
 
 def execute_from_cmd():
-    args = sys.argv[1:]
+    args = []
+    for arg in sys.argv[1:]:
+        if arg == "--trace" or arg.startswith("--trace="):
+            tracing.tracer.enable(arg.partition("=")[2] or None)
+        else:
+            args.append(arg)
     if not len(args):
         raise ValueError('Command was not provided')
     func = globals()[args[0]]
@@ -3,3 +3,6 @@ import numpy as np
 
 COLORS = np.array([[1, 0, 1], [0, 0, 1], [0, 1, 1], [0, 1, 0], [1, 1, 0], [1, 0, 0]])
 IMG_EXTENSIONS = (".jpg", ".png")
+LEASED_COLOR = (128, 128, 128)
+SHARED_SYNC_INTERVAL = 1000
+WATCH_INTERVAL = 1000
@@ -0,0 +1,142 @@
+import os
+import time
+import uuid
+import socket
+from pathlib import Path
+from typing import Set
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    '''Inter-process exclusive lock on a file, re-entrant within the same process'''
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = None
+        self.depth = 0
+
+    def acquire(self):
+        if self.depth == 0:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+            self.fd = fd
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class LeaseManager:
+    '''Per-image leases shared by every session working on the same dataset.
+
+    A lease is a file named after the image holding the owner session id, it expires
+    `ttl` seconds after its last renewal so crashed sessions don't hold images forever.
+    '''
+
+    def __init__(self, dir_path: Path, lock: FileLock, ttl: float = 60) -> None:
+        self.dir_path = Path(dir_path)
+        self.dir_path.mkdir(parents=True, exist_ok=True)
+        self.lock = lock
+        self.ttl = ttl
+        self.session_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.held: Set[str] = set()
+
+    def lease_path(self, name: str) -> Path:
+        return self.dir_path / (name + ".lease")
+
+    def owner(self, name: str):
+        path = self.lease_path(name)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                return None
+            with open(path, 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def acquire(self, name: str) -> bool:
+        with self.lock:
+            owner = self.owner(name)
+            if owner is not None and owner != self.session_id:
+                return False
+            with open(self.lease_path(name), 'w') as f:
+                f.write(self.session_id)
+        self.held.add(name)
+        return True
+
+    def release(self, name: str):
+        if name not in self.held:
+            return
+        self.held.discard(name)
+        with self.lock:
+            if self.owner(name) == self.session_id:
+                try:
+                    os.remove(self.lease_path(name))
+                except FileNotFoundError:
+                    pass
+
+    def release_all(self):
+        for name in list(self.held):
+            self.release(name)
+
+    def renew(self):
+        with self.lock:
+            for name in list(self.held):
+                # A lease that expired meanwhile may have been taken over by another session
+                try:
+                    with open(self.lease_path(name), 'r') as f:
+                        owned = f.read().strip() == self.session_id
+                    if owned:
+                        os.utime(self.lease_path(name))
+                except FileNotFoundError:
+                    owned = False
+                if not owned:
+                    self.held.discard(name)
+
+    def leased_by_others(self) -> Set[str]:
+        names = set()
+        now = time.time()
+        for entry in os.scandir(self.dir_path):
+            if not entry.name.endswith(".lease"):
+                continue
+            name = entry.name[:-len(".lease")]
+            try:
+                if entry.stat().st_mtime + self.ttl < now:
+                    continue
+                with open(entry.path, 'r') as f:
+                    if f.read().strip() == self.session_id:
+                        continue
+            except FileNotFoundError:
+                continue
+            names.add(name)
+        return names
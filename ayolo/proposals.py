@@ -0,0 +1,254 @@
+import os
+import re
+import sys
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from PyQt5 import QtCore, QtGui
+
+from . import tracing
+from .background import ImageList
+
+
+Box = Tuple[int, int, int, int, int]
+
+
+class ProposalProvider:
+    '''Base class for pre-annotation providers.
+
+    `propose` receives the path of one image and returns all of its boxes at once as
+    `(x1, y1, x2, y2, class_id)` in image pixels. Providers are built once up front to
+    validate the spec, then again inside each worker process, so they may hold unpicklable
+    state such as inference sessions.
+
+    `version` is part of the cache key, providers set it from whatever their output depends
+    on besides the spec, such as the model file.
+    '''
+
+    name = "provider"
+    version = ""
+
+    def propose(self, path: str) -> List[Box]:
+        raise NotImplementedError
+
+
+class StubProvider(ProposalProvider):
+    '''Proposes a single box over the center of the image, only reads the image header'''
+
+    name = "stub"
+
+    def __init__(self, class_id: str = "0") -> None:
+        self.class_id = int(class_id)
+
+    def propose(self, path: str) -> List[Box]:
+        size = QtGui.QImageReader(path).size()
+        width, height = size.width(), size.height()
+        if width <= 0 or height <= 0:
+            return []
+        return [(width // 4, height // 4, width * 3 // 4, height * 3 // 4, self.class_id)]
+
+
+class CallableProvider(ProposalProvider):
+    '''Wraps any importable `module:function` taking an image path and returning boxes'''
+
+    def __init__(self, target: str) -> None:
+        module_name, _, func_name = target.partition(':')
+        self.name = target
+        module = importlib.import_module(module_name)
+        self.func: Callable[[str], List[Box]] = getattr(module, func_name)
+        if getattr(module, "__file__", None):
+            self.version = file_version(module.__file__)
+
+    def propose(self, path: str) -> List[Box]:
+        return [tuple(int(v) for v in box[:5]) for box in self.func(path)]
+
+
+class OnnxProvider(ProposalProvider):
+    '''Runs an ONNX detector on CPU, requires `onnxruntime`.
+
+    The model takes a float32 `(1, 3, H, W)` RGB input scaled to [0, 1] and outputs
+    `(1, N, 6)` or `(N, 6)` rows of `x1, y1, x2, y2, score, class_id` in input pixels.
+    '''
+
+    def __init__(self, model_path: str, threshold: str = "0.5") -> None:
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("ONNX proposals require onnxruntime, install it with 'pip install onnxruntime'")
+        self.name = "onnx_" + Path(model_path).stem
+        self.version = file_version(model_path)
+        self.threshold = float(threshold)
+        options = onnxruntime.SessionOptions()
+        # Workers run in parallel already, keep each one single threaded
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0]
+        self.input_size = (self.input.shape[3], self.input.shape[2])
+
+    def propose(self, path: str) -> List[Box]:
+        import numpy as np
+
+        image = QtGui.QImage(path)
+        if image.isNull():
+            return []
+        width, height = image.width(), image.height()
+        image = image.scaled(*self.input_size).convertToFormat(QtGui.QImage.Format.Format_RGB888)
+        ptr = image.constBits()
+        ptr.setsize(image.sizeInBytes())
+        pixels = np.frombuffer(ptr, np.uint8).reshape(image.height(), image.bytesPerLine())[:, :image.width() * 3]
+        tensor = pixels.reshape(image.height(), image.width(), 3).transpose(2, 0, 1)[None].astype(np.float32) / 255
+        output = np.asarray(self.session.run(None, {self.input.name: tensor})[0]).reshape(-1, 6)
+        sx, sy = width / self.input_size[0], height / self.input_size[1]
+        return [
+            (round(x1 * sx), round(y1 * sy), round(x2 * sx), round(y2 * sy), int(cls))
+            for x1, y1, x2, y2, score, cls in output if score >= self.threshold
+        ]
+
+
+def file_version(path: str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def clamp_boxes(boxes: List[Box], width: int, height: int) -> List[Box]:
+    '''Order each box's corners and clip it to the image, dropping boxes left without area'''
+    clamped = []
+    for x1, y1, x2, y2, class_id in boxes:
+        x1, x2 = sorted((min(max(x1, 0), width), min(max(x2, 0), width)))
+        y1, y2 = sorted((min(max(y1, 0), height), min(max(y2, 0), height)))
+        if x1 < x2 and y1 < y2:
+            clamped.append((x1, y1, x2, y2, class_id))
+    return clamped
+
+
+PROVIDERS = {
+    "stub": StubProvider,
+    "onnx": OnnxProvider,
+}
+
+
+def split_provider_args(args: str) -> Tuple[str, ...]:
+    '''Split a trailing numeric option off, paths such as `C:\\models\\x.onnx` keep their colons'''
+    if not args:
+        return ()
+    head, sep, tail = args.rpartition(':')
+    try:
+        float(tail)
+    except ValueError:
+        return (args,)
+    return (head, tail) if sep and head else (tail,)
+
+
+def load_provider(spec: str) -> ProposalProvider:
+    '''Build a provider from `stub[:<class_id>]`, `onnx:<model_path>[:<threshold>]` or `<module>:<function>`'''
+    kind, _, args = spec.partition(':')
+    try:
+        if kind in PROVIDERS:
+            return PROVIDERS[kind](*split_provider_args(args))
+        return CallableProvider(spec)
+    except Exception as e:
+        raise ValueError(f"Could not load proposal provider '{spec}': {e}") from e
+
+
+_provider: Optional[ProposalProvider] = None
+
+
+def _init_worker(spec: str):
+    global _provider
+    _provider = load_provider(spec)
+
+
+def _propose(image_path: str, cache_path: str) -> Tuple[List[Box], bool]:
+    stat = os.stat(image_path)
+    stamp = f"{stat.st_mtime_ns} {stat.st_size} {_provider.version}"
+    try:
+        with open(cache_path, 'r') as f:
+            if f.readline().rstrip("\n") == stamp:
+                return ImageList.annotation_deserialize(f.readline().strip())[1], True
+    except (FileNotFoundError, ValueError, IndexError):
+        pass
+    size = QtGui.QImageReader(image_path).size()
+    boxes = clamp_boxes(_provider.propose(image_path), size.width(), size.height())
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(stamp + "\n")
+        f.write(ImageList.annotation_serialize(Path(image_path).name, boxes))
+    os.replace(tmp_path, cache_path)
+    return boxes, False
+
+
+def provider_cache_name(spec: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', spec).strip('_') or "provider"
+
+
+class ProposalScheduler(QtCore.QObject):
+    '''Runs a provider over images in a pool of worker processes.
+
+    Results are cached on disk by the workers and handed to the GUI thread through the
+    `proposed` signal, nothing here waits on a worker.
+    '''
+
+    proposed = QtCore.pyqtSignal(str, object)
+
+    def __init__(self, spec: str, dir_path: Path, workers: Optional[int] = None, lookahead: int = 8) -> None:
+        super().__init__()
+        # Fail here with a clear message rather than inside the workers, where a broken pool would abort the GUI
+        load_provider(spec)
+        self.enabled = True
+        self.dir_path = Path(dir_path)
+        self.cache_path = self.dir_path / ".ayolo" / "proposals" / provider_cache_name(spec)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self.lookahead = lookahead
+        self.results: Dict[str, List[Box]] = {}
+        self.pending = {}
+        # Spawned workers don't inherit the GUI's Qt state
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers or max(1, min(4, (os.cpu_count() or 2) - 1)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(spec,),
+        )
+
+    def request(self, names: List[str]):
+        '''Queue proposals for `names` in priority order, dropping queued work for images no longer wanted'''
+        if not self.enabled:
+            return
+        wanted = set(names)
+        for name, future in list(self.pending.items()):
+            if name not in wanted and future.cancel():
+                self.pending.pop(name, None)
+        for name in names:
+            if name in self.results or name in self.pending:
+                continue
+            try:
+                future = self.executor.submit(_propose, str(self.dir_path / name), str(self.cache_path / (name + ".txt")))
+            except BrokenProcessPool as e:
+                print(f"Proposal workers stopped, proposals are turned off: {e}", file=sys.stderr)
+                self.shutdown()
+                return
+            self.pending[name] = future
+            future.add_done_callback(lambda future, name=name: self.finished(name, future))
+
+    def finished(self, name: str, future):
+        # Runs on the executor's thread, the signal is queued to the GUI thread
+        if self.pending.get(name) is future:
+            del self.pending[name]
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            print(f"Proposal for {name} failed: {future.exception()!r}", file=sys.stderr)
+            return
+        boxes, cached = future.result()
+        tracing.count("proposal_cache_hit" if cached else "proposal_cache_miss")
+        self.results[name] = boxes
+        self.proposed.emit(name, boxes)
+
+    def shutdown(self):
+        self.enabled = False
+        for future in list(self.pending.values()):
+            future.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import atexit
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Optional
+
+
+TRACE_ENV = "AYOLO_TRACE"
+TRACE_BUFFER_ENV = "AYOLO_TRACE_BUFFER"
+DEFAULT_TRACE_PATH = "ayolo-trace.json"
+
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    '''Opt-in recorder of timed spans and counters, kept in a fixed size ring buffer'''
+
+    def __init__(self, capacity: int = 100000) -> None:
+        self.enabled = False
+        self.output_path: Optional[str] = None
+        self.pid = os.getpid()
+        self.epoch = time.perf_counter_ns()
+        self.spans = deque(maxlen=capacity)
+        self.counters: Dict[str, int] = {}
+        self.exit_registered = False
+
+    def enable(self, output_path: Optional[str] = None, capacity: Optional[int] = None):
+        if capacity is not None and capacity != self.spans.maxlen:
+            self.spans = deque(self.spans, maxlen=capacity)
+        self.output_path = output_path or self.output_path or DEFAULT_TRACE_PATH
+        self.enabled = True
+        if not self.exit_registered:
+            # Whatever command is running, the summary and trace file are written when the process exits
+            atexit.register(self.export)
+            atexit.register(self.print_summary)
+            self.exit_registered = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self.spans.clear()
+        self.counters.clear()
+
+    def span(self, name: str, cat: str = "ayolo"):
+        if not self.enabled:
+            return NULL_SPAN
+        return self._span(name, cat)
+
+    @contextmanager
+    def _span(self, name: str, cat: str):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            # deque.append is atomic, so worker threads can record spans without a lock
+            self.spans.append((name, cat, start, time.perf_counter_ns() - start, threading.get_ident()))
+
+    def traced(self, name: str, cat: str = "ayolo"):
+        '''Decorator version of `span`, costs a single attribute lookup per call while disabled'''
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self._span(name, cat):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, value: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> Dict[str, dict]:
+        stats = {}
+        for name, _, _, dur, _ in list(self.spans):
+            entry = stats.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += dur / 1e6
+            entry["max_ms"] = max(entry["max_ms"], dur / 1e6)
+        for entry in stats.values():
+            entry["mean_ms"] = entry["total_ms"] / entry["count"]
+        return stats
+
+    def format_summary(self) -> str:
+        lines = [f"{'span':<24}{'count':>8}{'total ms':>12}{'mean ms':>10}{'max ms':>10}"]
+        for name, entry in sorted(self.summary().items(), key=lambda item: -item[1]["total_ms"]):
+            lines.append(f"{name:<24}{entry['count']:>8}{entry['total_ms']:>12.2f}{entry['mean_ms']:>10.3f}{entry['max_ms']:>10.3f}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<24}{value:>8}")
+        return "\n".join(lines)
+
+    def print_summary(self, file=None):
+        if self.enabled:
+            print(self.format_summary(), file=file or sys.stderr, flush=True)
+
+    def trace_events(self) -> list:
+        events = []
+        for name, cat, start, dur, tid in list(self.spans):
+            events.append({
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": (start - self.epoch) / 1000,
+                "dur": dur / 1000,
+                "pid": self.pid,
+                "tid": tid,
+            })
+        now = (time.perf_counter_ns() - self.epoch) / 1000
+        for name, value in self.counters.items():
+            events.append({"name": name, "ph": "C", "ts": now, "pid": self.pid, "args": {name: value}})
+        return events
+
+    def export(self, path: Optional[str] = None) -> Optional[str]:
+        '''Write recorded spans as Chrome trace event JSON (chrome://tracing, Perfetto)'''
+        path = path or self.output_path
+        if not self.enabled or not path:
+            return None
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+        return path
+
+
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+count = tracer.count
+
+
+def enable_from_env():
+    value = os.environ.get(TRACE_ENV)
+    if not value or value == "0":
+        return
+    capacity = os.environ.get(TRACE_BUFFER_ENV)
+    tracer.enable(None if value == "1" else value, int(capacity) if capacity else None)
+
+
+enable_from_env()
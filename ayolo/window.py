@@ -1,12 +1,17 @@
+import os
 import sys
 from functools import partial
+from itertools import islice
 from pathlib import Path
 from typing import List, Tuple
 
 from PyQt5 import QtWidgets, QtCore, QtGui
 from darktheme.widget_template import DarkPalette
 
+from . import tracing
 from .background import Background
+from .proposals import ProposalScheduler
+from .constants import LEASED_COLOR, SHARED_SYNC_INTERVAL, WATCH_INTERVAL
 from .utilities import PropagableLineEdit
 
 
@@ -29,15 +34,22 @@ class Annotator(QtWidgets.QWidget):
         self.deleted = False
         self.nulled = False
         self.current_annotations = []
+        self.draft_annotations = []
+        self.pixmap_cache = None
 
         self.setMouseTracking(True)
         self.setCursor(QtCore.Qt.CursorShape.BlankCursor)
         self.show()
 
+    @tracing.traced("paint", "gui")
     def paintEvent(self, event):
         painter = QtGui.QPainter(self)
         if self.current_img_path:
             self.draw_img(painter, self.current_img_path)
+        for x1, y1, x2, y2, clas in self.draft_annotations:
+            rgb = self.background.get_color(clas, self.background.control_panel.classlength)
+            self.modify_painter_draft_pen(painter, rgb)
+            painter.drawRect(QtCore.QRect(self.get_scaled_coordinate(x1, y1), self.get_scaled_coordinate(x2, y2)))
         for x1, y1, x2, y2, clas in self.current_annotations:
             rgb = self.background.get_color(clas, self.background.control_panel.classlength)
             self.modify_painter_brush_and_pen(painter, rgb)
@@ -124,14 +136,31 @@ class Annotator(QtWidgets.QWidget):
         pen.setWidth(2)
         painter.setPen(pen)
 
+    def modify_painter_draft_pen(self, painter: QtGui.QPainter, rgb):
+        painter.setBrush(QtCore.Qt.BrushStyle.NoBrush)
+        pen = QtGui.QPen(QtGui.QColor(*rgb))
+        pen.setWidth(2)
+        pen.setStyle(QtCore.Qt.PenStyle.DashLine)
+        painter.setPen(pen)
+
     def draw_img(self, painter: QtGui.QPainter, path: Path):
         size = self.size()
         point = QtCore.QPoint(0, 0)
-        pixmap = QtGui.QPixmap(str(path))
-        original_size = (pixmap.size().width(), pixmap.size().height())
-        scaledPix = pixmap.scaled(size, QtCore.Qt.AspectRatioMode.KeepAspectRatio, transformMode=QtCore.Qt.TransformationMode.SmoothTransformation)
-        point.setX((size.width() - scaledPix.width())/2)
-        point.setY((size.height() - scaledPix.height())/2)
+        cache_key = (path, size.width(), size.height())
+        if self.pixmap_cache is not None and self.pixmap_cache[0] == cache_key:
+            tracing.count("pixmap_cache_hit")
+            _, original_size, scaledPix = self.pixmap_cache
+        else:
+            tracing.count("pixmap_cache_miss")
+            with tracing.span("decode", "gui"):
+                pixmap = QtGui.QPixmap(str(path))
+            original_size = (pixmap.size().width(), pixmap.size().height())
+            with tracing.span("scale", "gui"):
+                scaledPix = pixmap.scaled(size, QtCore.Qt.AspectRatioMode.KeepAspectRatio, transformMode=QtCore.Qt.TransformationMode.SmoothTransformation)
+            if not pixmap.isNull():
+                self.pixmap_cache = (cache_key, original_size, scaledPix)
+        point.setX((size.width() - scaledPix.width()) // 2)
+        point.setY((size.height() - scaledPix.height()) // 2)
         self.img_bounds = (point.x(), point.y(), point.x() + scaledPix.size().width(), point.y() + scaledPix.size().height())
         try:
             self.ratio = (original_size[0] / scaledPix.width(), original_size[1] / scaledPix.height())
@@ -181,7 +210,9 @@ class Annotator(QtWidgets.QWidget):
 
     def open_image(self, path: Path, annotations):
         self.current_img_path = path
+        self.pixmap_cache = None
         self.current_annotations = annotations
+        self.draft_annotations = []
         self.background.control_panel.update_current_annotations_lw(self.current_annotations)
         self.deleted = False
         self.drawing = False
@@ -204,6 +235,26 @@ class Annotator(QtWidgets.QWidget):
         self.background.control_panel.update_current_annotations_lw(self.current_annotations)
         self.update()
 
+    def show_proposals(self, img_name: str, boxes):
+        '''Show proposed boxes as drafts, only while the image is still unannotated'''
+        if self.current_img_path is None or self.current_img_path.name != img_name:
+            return
+        if self.background.images.image_annotation_counts.get(img_name, 0) is not None:
+            return
+        classlength = self.background.control_panel.classlength
+        self.draft_annotations = [tuple(box) for box in boxes if 0 <= box[4] < classlength]
+        self.update()
+
+    def accept_proposals(self):
+        self.current_annotations.extend(self.draft_annotations)
+        self.draft_annotations = []
+        self.background.control_panel.update_current_annotations_lw(self.current_annotations)
+        self.update()
+
+    def reject_proposals(self):
+        self.draft_annotations = []
+        self.update()
+
 
 class ControlPanel(QtWidgets.QWidget):
     '''Widget for control panel section (right)'''
@@ -245,6 +296,13 @@ class ControlPanel(QtWidgets.QWidget):
         layout.addWidget(self.undo_btn)
         layout.addWidget(self.delete_btn)
         layout.addWidget(self.clear_btn)
+        if self.background.proposals is not None:
+            self.accept_btn = QtWidgets.QPushButton('Accept (E)')
+            self.accept_btn.clicked.connect(self.background.annotator.accept_proposals)
+            self.reject_btn = QtWidgets.QPushButton('Reject (R)')
+            self.reject_btn.clicked.connect(self.background.annotator.reject_proposals)
+            layout.addWidget(self.accept_btn)
+            layout.addWidget(self.reject_btn)
         layout.addWidget(QtWidgets.QLabel('Class Search'))
         layout.addWidget(self.search)
         layout.addWidget(self.classes_lw)
@@ -276,6 +334,7 @@ class ControlPanel(QtWidgets.QWidget):
         self.sorted_class_ids_by_name = sorted(list(range(self.classlength)), key=lambda x: self.classnames[x])
         self.search_result_class_ids = list(range(self.classlength))
 
+    @tracing.traced("search", "gui")
     def update_search_results(self, text: str):
         self.classes_lw.currentRowChanged.disconnect()
         self.classes_lw.clear()
@@ -344,10 +403,13 @@ class ImageBrowser(QtWidgets.QWidget):
         self.background.image_browser = self
         self.images_states = self.background.images.image_annotation_counts
         self.image_names = {}
+        self.list_items = {}
+        self.leased_names = set()
         self.current_image_name = None
         self.updating = False
         self.current_lw = None
         self.current_lw_index = None
+        self.direction = 1
 
         layout = QtWidgets.QVBoxLayout()
 
@@ -383,25 +445,35 @@ class ImageBrowser(QtWidgets.QWidget):
     def selected_image_changed(self, lw_index: int, row: int):
         if row == -1 or self.updating:
             return
-        self.background.annotator.save_annotations()
-        self.background.annotator.clear_annotations()
         this_lw = self.lw_list[lw_index]
         img_name = self.image_names[this_lw.currentItem().text()] # Switch back (when item name != item path)
+        if self.background.leases is not None and img_name != self.current_image_name and not self.background.leases.acquire(img_name):
+            # Opened by another session, skip it in the direction we were going
+            if 0 <= row + self.direction < this_lw.count():
+                this_lw.setCurrentRow(row + self.direction)
+            else:
+                self.update_list_widgets()
+            return
+        self.background.annotator.save_annotations()
+        self.background.annotator.clear_annotations()
         other_ind = (lw_index + 1) % len(self.lw_list)
         other_lw = self.lw_list[other_ind]
         if other_lw.currentRow() != -1:
             other_lw.clearSelection()
         self.load_image(img_name)
 
+    @tracing.traced("rebuild", "gui")
     def update_list_widgets(self):
         self.updating = True
         self.annotated_lw.clear()
         self.unannotated_lw.clear()
         self.image_names = {}
+        self.list_items = {}
         for img_name, count in self.images_states.items():
             if count is None:
                 title = img_name
-                self.unannotated_lw.addItem(QtWidgets.QListWidgetItem(title))
+                self.list_items[img_name] = self.new_list_item(img_name, title)
+                self.unannotated_lw.addItem(self.list_items[img_name])
                 self.image_names[title] = img_name
                 if img_name == self.current_image_name:
                     self.unannotated_lw.setCurrentRow(self.unannotated_lw.count() - 1)
@@ -409,7 +481,8 @@ class ImageBrowser(QtWidgets.QWidget):
                     self.current_lw_index = 1
             else:
                 title = f"{img_name} ({count})"
-                self.annotated_lw.addItem(QtWidgets.QListWidgetItem(title))
+                self.list_items[img_name] = self.new_list_item(img_name, title)
+                self.annotated_lw.addItem(self.list_items[img_name])
                 self.image_names[title] = img_name
                 if img_name == self.current_image_name:
                     self.annotated_lw.setCurrentRow(self.annotated_lw.count() - 1)
@@ -420,22 +493,110 @@ class ImageBrowser(QtWidgets.QWidget):
         self.update()
         self.updating = False
 
+    def new_list_item(self, img_name, title):
+        item = QtWidgets.QListWidgetItem(title)
+        if img_name in self.leased_names:
+            item.setForeground(QtGui.QColor(*LEASED_COLOR))
+        return item
+
+    def update_image_item(self, img_name):
+        '''Move, retitle, add or drop a single image's item without rebuilding the lists'''
+        self.updating = True
+        item = self.list_items.pop(img_name, None)
+        if item is not None:
+            self.image_names.pop(item.text(), None)
+            lw = item.listWidget()
+            lw.takeItem(lw.row(item))
+        if img_name in self.images_states:
+            count = self.images_states[img_name]
+            title = img_name if count is None else f"{img_name} ({count})"
+            lw_index = 1 if count is None else 0
+            lw = self.lw_list[lw_index]
+            # Both lists are in natural order, find the row by binary search
+            key = Background.alphanumeric_key(img_name)
+            row, hi = 0, lw.count()
+            while row < hi:
+                mid = (row + hi) // 2
+                if Background.alphanumeric_key(self.image_names[lw.item(mid).text()]) <= key:
+                    row = mid + 1
+                else:
+                    hi = mid
+            self.list_items[img_name] = self.new_list_item(img_name, title)
+            self.image_names[title] = img_name
+            lw.insertItem(row, self.list_items[img_name])
+            if img_name == self.current_image_name:
+                lw.setCurrentRow(row)
+                self.current_lw = lw
+                self.current_lw_index = lw_index
+        self.annotated_lb.setText(f"Annotated ({self.annotated_lw.count()})")
+        self.unannotated_lb.setText(f"Unannotated ({self.unannotated_lw.count()})")
+        self.updating = False
+
+    def refresh_images(self):
+        '''Pick up images added to or removed from the dataset directory'''
+        added, removed = self.background.images.refresh()
+        for img_name in removed + added:
+            self.update_image_item(img_name)
+        if self.current_image_name in removed:
+            # Keep unsaved boxes, they come back with the image if it reappears
+            self.background.annotator.save_annotations()
+            for lw_index in (self.current_lw_index, (self.current_lw_index + 1) % len(self.lw_list)):
+                lw = self.lw_list[lw_index]
+                if lw.count():
+                    self.updating = True
+                    lw.setCurrentRow(min(max(lw.currentRow(), 0), lw.count() - 1))
+                    self.updating = False
+                    self.selected_image_changed(lw_index, lw.currentRow())
+                    break
+
+    def sync_shared(self):
+        '''Pick up annotations and leases changed by other sessions on the same dataset'''
+        leases = self.background.leases
+        leases.renew()
+        for img_name in self.background.images.sync():
+            self.update_image_item(img_name)
+        leased_names = leases.leased_by_others()
+        for img_name in leased_names ^ self.leased_names:
+            item = self.list_items.get(img_name)
+            if item is not None:
+                item.setForeground(QtGui.QColor(*LEASED_COLOR) if img_name in leased_names else self.palette().text())
+        self.leased_names = leased_names
+
+    @tracing.traced("load_image", "gui")
     def load_image(self, img_name):
+        if self.background.leases is not None and self.current_image_name not in (None, img_name):
+            self.background.leases.release(self.current_image_name)
         self.background.annotator.open_image(self.background.dir_path / img_name, self.background.images.annotations.get(img_name, []))
         self.current_image_name = img_name
         self.update_list_widgets()
+        if self.background.proposals is not None:
+            self.request_proposals(img_name)
+
+    def request_proposals(self, img_name):
+        '''Ask for proposals of the current image and the next unannotated ones after it'''
+        proposals = self.background.proposals
+        names = self.background.images.image_names
+        start = names.index(img_name) if img_name in names else 0
+        wanted = islice((name for name in islice(names, start, None) if self.images_states.get(name, 0) is None), proposals.lookahead + 1)
+        proposals.request(list(wanted))
+        if img_name in proposals.results:
+            self.background.annotator.show_proposals(img_name, proposals.results[img_name])
 
     def other_lw(self, index):
         return self.lw_list[(index + 1) % len(self.lw_list)]
 
+    @tracing.traced("navigate", "gui")
     def navigate_prev(self):
+        self.direction = -1
         other_lw = self.other_lw(self.current_lw_index)
         if self.current_lw.currentRow() - 1 < 0 and other_lw.count():
             other_lw.setCurrentRow(other_lw.count() - 1)
         else:
             self.current_lw.setCurrentRow((self.current_lw.currentRow() - 1) % self.current_lw.count())
 
+    @tracing.traced("navigate", "gui")
     def navigate_next(self):
+        self.direction = 1
         other_lw = self.other_lw(self.current_lw_index)
         if self.current_lw.currentRow() + 1 >= self.current_lw.count() and other_lw.count():
             other_lw.setCurrentRow(0)
@@ -445,7 +606,7 @@ class ImageBrowser(QtWidgets.QWidget):
 
 class MainWindow(QtWidgets.QMainWindow):
 
-    def __init__(self, dir_path: str, *args, **kwargs):
+    def __init__(self, dir_path: str, *args, shared: bool = False, propose: str = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.setWindowTitle("Ayolo - Annotating tool for yolo v4 datasets")
 
@@ -456,7 +617,9 @@ class MainWindow(QtWidgets.QMainWindow):
 
         layout = QtWidgets.QHBoxLayout()
 
-        self.background = Background(dir_path)
+        self.background = Background(dir_path, shared=shared)
+        if propose:
+            self.background.proposals = ProposalScheduler(propose, self.background.dir_path)
         self.annotator = Annotator(self.background)
         self.control_panel = ControlPanel(self.background)
         self.image_browser = ImageBrowser(self.background)
@@ -475,6 +638,12 @@ class MainWindow(QtWidgets.QMainWindow):
         self.nav_prev_sc.activated.connect(self.image_browser.prev_btn.animateClick)
         self.nav_next_sc = QtWidgets.QShortcut(QtCore.Qt.Key.Key_PageDown, self)
         self.nav_next_sc.activated.connect(self.image_browser.next_btn.animateClick)
+        if self.background.proposals is not None:
+            self.accept_sc = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+E"), self)
+            self.accept_sc.activated.connect(self.control_panel.accept_btn.animateClick)
+            self.reject_sc = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+R"), self)
+            self.reject_sc.activated.connect(self.control_panel.reject_btn.animateClick)
+            self.background.proposals.proposed.connect(self.annotator.show_proposals)
 
         layout.setContentsMargins(0, 20, 0, 20)
 
@@ -483,6 +652,16 @@ class MainWindow(QtWidgets.QMainWindow):
         layout.addWidget(self.control_panel, 2)
 
         widget.setLayout(layout)
+
+        self.watch_timer = QtCore.QTimer(self)
+        self.watch_timer.timeout.connect(self.image_browser.refresh_images)
+        self.watch_timer.start(WATCH_INTERVAL)
+
+        if shared:
+            self.sync_timer = QtCore.QTimer(self)
+            self.sync_timer.timeout.connect(self.image_browser.sync_shared)
+            self.sync_timer.start(SHARED_SYNC_INTERVAL)
+
         self.background.control_panel.search.setFocus()
         self.activateWindow()
 
@@ -496,6 +675,10 @@ class MainWindow(QtWidgets.QMainWindow):
 
         if close == QtWidgets.QMessageBox.Yes:
             self.annotator.save_annotations()
+            if self.background.leases is not None:
+                self.background.leases.release_all()
+            if self.background.proposals is not None:
+                self.background.proposals.shutdown()
             event.accept()
         else:
             event.ignore()
@@ -507,14 +690,19 @@ class MainWindow(QtWidgets.QMainWindow):
         self.move(qtRectangle.topLeft())
 
     @classmethod
-    def run(cls, dir_path):
+    def run(cls, dir_path, shared=False, propose=None):
         app = QtWidgets.QApplication(sys.argv)
 
         app.setStyle("Fusion")
         app.setPalette(DarkPalette())
         app.setStyleSheet("QToolTip { color: #ffffff; background-color: grey; border: 1px solid white; }")
 
-        main = cls(dir_path)
+        main = cls(dir_path, shared=shared, propose=propose)
         main.show()
 
+        if tracing.tracer.enabled:
+            summary_timer = QtCore.QTimer(main)
+            summary_timer.timeout.connect(tracing.tracer.print_summary)
+            summary_timer.start(int(float(os.environ.get("AYOLO_TRACE_INTERVAL", 30)) * 1000))
+
         sys.exit(app.exec_())
@@ -0,0 +1,8 @@
+import pytest
+
+from ayolo import commands
+
+
+def test_annotate_rejects_unknown_options(tmp_path):
+    with pytest.raises(ValueError, match="sharde"):
+        commands.annotate(str(tmp_path), "sharde")
@@ -0,0 +1,54 @@
+import os
+import time
+
+from ayolo.locking import FileLock, LeaseManager
+
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_leases_between_two_sessions(tmp_path):
+    lock = FileLock(tmp_path / "lock")
+    first = LeaseManager(tmp_path / "leases", lock, ttl=5)
+    second = LeaseManager(tmp_path / "leases", lock, ttl=5)
+
+    assert first.acquire("img_0.png")
+    assert first.acquire("img_0.png")
+    assert not second.acquire("img_0.png")
+    assert second.owner("img_0.png") == first.session_id
+    assert second.leased_by_others() == {"img_0.png"}
+    assert first.leased_by_others() == set()
+
+    # A lease not renewed within the ttl is up for grabs
+    age(first.lease_path("img_0.png"), 10)
+    assert second.leased_by_others() == set()
+    assert second.acquire("img_0.png")
+    assert first.leased_by_others() == {"img_0.png"}
+
+    # Releasing a lease taken over by another session leaves it in place
+    first.release("img_0.png")
+    assert second.owner("img_0.png") == second.session_id
+    second.release_all()
+    assert not os.path.exists(second.lease_path("img_0.png"))
+    assert first.acquire("img_0.png")
+
+
+def test_renew_keeps_leases_alive(tmp_path):
+    lock = FileLock(tmp_path / "lock")
+    first = LeaseManager(tmp_path / "leases", lock, ttl=5)
+    second = LeaseManager(tmp_path / "leases", lock, ttl=5)
+
+    first.acquire("img_0.png")
+    age(first.lease_path("img_0.png"), 10)
+    first.renew()
+    assert not second.acquire("img_0.png")
+    assert first.held == {"img_0.png"}
+
+    # Once taken over, the lease is no longer renewed nor counted as held
+    age(first.lease_path("img_0.png"), 10)
+    assert second.acquire("img_0.png")
+    first.renew()
+    assert first.held == set()
+    assert first.leased_by_others() == {"img_0.png"}
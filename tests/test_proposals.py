@@ -0,0 +1,169 @@
+import os
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PyQt5 import QtWidgets
+
+from ayolo import proposals
+from ayolo.benchmarks import generate_dataset
+from ayolo.proposals import CallableProvider, ProposalScheduler, StubProvider, load_provider
+
+
+@pytest.fixture(scope="module")
+def qapp():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def dataset(qapp, tmp_path):
+    return generate_dataset(tmp_path, images=4, boxes=1, classes=3, size=(80, 60))
+
+
+class RecordingProvider:
+
+    def __init__(self, *args):
+        self.args = args
+
+
+class CountingProvider(proposals.ProposalProvider):
+
+    def __init__(self):
+        self.calls = 0
+
+    def propose(self, path):
+        self.calls += 1
+        return [(1, 2, 3, 4, 0)]
+
+
+class OutOfBoundsProvider(proposals.ProposalProvider):
+
+    def propose(self, path):
+        # Larger than the image, corners swapped, zero area and fully outside
+        return [(-10, -10, 500, 500, 0), (30, 25, 10, 5, 1), (7, 7, 7, 20, 1), (100, 100, 120, 120, 2)]
+
+
+def wait_for(qapp, condition, timeout=30):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        qapp.processEvents()
+        time.sleep(0.01)
+    return condition()
+
+
+def test_load_provider_parsing(monkeypatch):
+    monkeypatch.setitem(proposals.PROVIDERS, "onnx", RecordingProvider)
+    assert load_provider("onnx:model.onnx").args == ("model.onnx",)
+    assert load_provider("onnx:model.onnx:0.3").args == ("model.onnx", "0.3")
+    assert load_provider("onnx:C:\\models\\x.onnx").args == ("C:\\models\\x.onnx",)
+    assert load_provider("onnx:C:\\models\\x.onnx:0.3").args == ("C:\\models\\x.onnx", "0.3")
+
+    assert load_provider("stub").class_id == 0
+    assert load_provider("stub:2").class_id == 2
+
+    provider = load_provider("os.path:basename")
+    assert isinstance(provider, CallableProvider)
+    assert provider.func is os.path.basename
+
+
+def test_load_provider_bad_spec():
+    with pytest.raises(ValueError, match="nonexistent_mod:f"):
+        load_provider("nonexistent_mod:f")
+
+
+def test_propose_cache(monkeypatch, dataset):
+    provider = CountingProvider()
+    monkeypatch.setattr(proposals, "_provider", provider)
+    image_path = str(dataset / "img_0.png")
+    cache_path = str(dataset / "img_0.png.txt")
+
+    assert proposals._propose(image_path, cache_path) == ([(1, 2, 3, 4, 0)], False)
+    assert proposals._propose(image_path, cache_path) == ([(1, 2, 3, 4, 0)], True)
+    assert provider.calls == 1
+
+    stat = os.stat(image_path)
+    os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert proposals._propose(image_path, cache_path) == ([(1, 2, 3, 4, 0)], False)
+    assert provider.calls == 2
+
+    with open(image_path, 'ab') as f:
+        f.write(b"\0")
+    assert proposals._propose(image_path, cache_path)[1] is False
+    assert provider.calls == 3
+
+
+def test_propose_cache_follows_provider_version(monkeypatch, dataset):
+    provider = CountingProvider()
+    monkeypatch.setattr(proposals, "_provider", provider)
+    image_path = str(dataset / "img_0.png")
+    cache_path = str(dataset / "img_0.png.txt")
+
+    proposals._propose(image_path, cache_path)
+    provider.version = "retrained"
+    assert proposals._propose(image_path, cache_path)[1] is False
+    assert proposals._propose(image_path, cache_path)[1] is True
+    assert provider.calls == 2
+
+
+def test_callable_provider_version_follows_module_file():
+    assert CallableProvider("os.path:basename").version == proposals.file_version(os.path.__file__)
+
+
+def test_proposals_are_clamped_to_the_image(monkeypatch, dataset):
+    monkeypatch.setattr(proposals, "_provider", OutOfBoundsProvider())
+    image_path = str(dataset / "img_0.png")
+    boxes, _ = proposals._propose(image_path, str(dataset / "img_0.png.txt"))
+    assert boxes == [(0, 0, 80, 60, 0), (10, 5, 30, 25, 1)]
+    assert proposals._propose(image_path, str(dataset / "img_0.png.txt")) == (boxes, True)
+
+
+def test_scheduler_delivers_stub_proposals(qapp, dataset):
+    scheduler = ProposalScheduler("stub", dataset, workers=1)
+    received = {}
+    scheduler.proposed.connect(lambda name, boxes: received.update({name: boxes}))
+    try:
+        scheduler.request(["img_0.png", "img_1.png"])
+        assert wait_for(qapp, lambda: len(received) == 2)
+    finally:
+        scheduler.shutdown()
+    assert received["img_0.png"] == StubProvider().propose(str(dataset / "img_0.png")) == [(20, 15, 60, 45, 0)]
+    assert os.path.isfile(scheduler.cache_path / "img_1.png.txt")
+
+
+def test_scheduler_bad_spec_fails_at_startup(qapp, dataset):
+    with pytest.raises(ValueError):
+        ProposalScheduler("nonexistent_mod:f", dataset)
+
+
+def test_scheduler_turns_off_on_broken_pool(qapp, dataset, monkeypatch):
+    scheduler = ProposalScheduler("stub", dataset, workers=1)
+
+    def broken_submit(*args, **kwargs):
+        raise proposals.BrokenProcessPool("worker died")
+
+    monkeypatch.setattr(scheduler.executor, "submit", broken_submit)
+    scheduler.request(["img_0.png"])
+    assert not scheduler.enabled
+    scheduler.request(["img_1.png"])
+    assert scheduler.pending == {}
+
+
+def test_show_proposals_drops_unknown_classes(qapp, dataset):
+    from ayolo.window import MainWindow
+
+    main = MainWindow(str(dataset))
+    annotator = main.annotator
+    name = main.image_browser.current_image_name
+    assert main.background.images.image_annotation_counts[name] is None
+
+    annotator.show_proposals(name, [(1, 1, 5, 5, 0), (2, 2, 6, 6, 2), (3, 3, 7, 7, 3), (4, 4, 8, 8, -1)])
+    assert annotator.draft_annotations == [(1, 1, 5, 5, 0), (2, 2, 6, 6, 2)]
+
+    annotator.show_proposals("other.png", [(1, 1, 5, 5, 1)])
+    assert annotator.draft_annotations == [(1, 1, 5, 5, 0), (2, 2, 6, 6, 2)]
+
+    annotator.accept_proposals()
+    assert annotator.current_annotations[-2:] == [(1, 1, 5, 5, 0), (2, 2, 6, 6, 2)]
+    assert annotator.draft_annotations == []
+    main.hide()
@@ -0,0 +1,124 @@
+import os
+import time
+from pathlib import Path
+
+from ayolo.background import ImageList
+
+
+def make_dataset(tmp_path: Path, names) -> Path:
+    for name in names:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "annotations.txt").write_text("")
+    return tmp_path / "annotations.txt"
+
+
+def test_added_images_keep_natural_order(tmp_path):
+    images = ImageList(make_dataset(tmp_path, ["img_1.png", "img_2.png", "img_10.png"]))
+    (tmp_path / "sub").mkdir()
+    for name in ["img_3.png", "sub/img_20.png", "img_1b.png"]:
+        (tmp_path / name).write_bytes(b"")
+
+    added, removed = images.refresh(settle=0)
+    assert sorted(added) == ["img_1b.png", "img_20.png", "img_3.png"]
+    assert removed == []
+    assert images.image_names == ["img_1.png", "img_1b.png", "img_2.png", "img_3.png", "img_10.png", "img_20.png"]
+    assert list(images.image_annotation_counts) == images.image_names
+    assert images.refresh(settle=0) == ([], [])
+
+
+def test_fresh_images_are_deferred(tmp_path):
+    images = ImageList(make_dataset(tmp_path, ["img_1.png"]))
+    (tmp_path / "img_2.png").write_bytes(b"")
+    assert images.refresh(settle=60) == ([], [])
+
+    past = time.time() - 120
+    os.utime(tmp_path / "img_2.png", (past, past))
+    assert images.refresh(settle=60) == (["img_2.png"], [])
+
+
+def test_missing_images_keep_their_annotations(tmp_path):
+    annotation_path = make_dataset(tmp_path, ["img_1.png", "img_2.png", "img_3.png"])
+    images = ImageList(annotation_path)
+    images.save("img_1.png", [(1, 1, 2, 2, 0)])
+    images.save("img_2.png", [(3, 3, 4, 4, 1)])
+
+    os.rename(tmp_path / "img_2.png", tmp_path.parent / "moved.png")
+    assert images.refresh(settle=0) == ([], ["img_2.png"])
+    images.save("img_3.png", [(5, 5, 6, 6, 0)])
+    assert ImageList(annotation_path).annotations["img_2.png"] == [(3, 3, 4, 4, 1)]
+
+    os.rename(tmp_path.parent / "moved.png", tmp_path / "img_2.png")
+    assert images.refresh(settle=0) == (["img_2.png"], [])
+    assert images.image_annotation_counts["img_2.png"] == 1
+
+
+def test_unreachable_dataset_is_skipped(tmp_path):
+    dataset = tmp_path / "dataset"
+    dataset.mkdir()
+    annotation_path = make_dataset(dataset, ["img_1.png", "img_2.png"])
+    images = ImageList(annotation_path)
+    images.save("img_1.png", [(1, 1, 2, 2, 0)])
+
+    os.rename(dataset, tmp_path / "away")
+    assert images.refresh(settle=0) == ([], [])
+    os.rename(tmp_path / "away", dataset)
+    assert images.refresh(settle=0) == ([], [])
+    assert images.image_names == ["img_1.png", "img_2.png"]
+
+    images.save("img_2.png", [(3, 3, 4, 4, 0)])
+    assert set(ImageList(annotation_path).annotations) == {"img_1.png", "img_2.png"}
+
+
+def test_symlinks_are_not_followed(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "img_2.png").write_bytes(b"")
+    # A directory loop and a dangling link must neither hang nor break the scan
+    os.symlink(tmp_path, tmp_path / "sub" / "loop")
+    os.symlink(tmp_path / "nowhere.png", tmp_path / "img_3.png")
+    images = ImageList(make_dataset(tmp_path, ["img_1.png"]))
+    assert images.image_names == ["img_1.png", "img_2.png", "img_3.png"]
+
+    # Only the entry that can't be stat'ed is skipped, its siblings are still picked up
+    (tmp_path / "img_4.png").write_bytes(b"")
+    past = time.time() - 120
+    os.utime(tmp_path / "img_4.png", (past, past))
+    os.symlink(tmp_path / "nowhere.png", tmp_path / "img_5.png")
+    assert images.refresh(settle=60) == (["img_4.png"], [])
+    assert "img_1.png" in images.image_names
+
+
+def test_removed_current_image_keeps_unsaved_boxes(tmp_path):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    from ayolo.benchmarks import generate_dataset
+    from ayolo.window import MainWindow
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    dataset = generate_dataset(tmp_path / "dataset", images=3, boxes=0, classes=2, size=(40, 30))
+    main = MainWindow(str(dataset))
+    browser = main.image_browser
+    images = main.background.images
+    name = browser.current_image_name
+    for img_name in images.image_names:
+        if img_name != name:
+            images.save(img_name, [(2, 2, 6, 6, 0)])
+            browser.update_image_item(img_name)
+    main.annotator.current_annotations = [(1, 1, 5, 5, 1)]
+
+    os.rename(dataset / name, tmp_path / name)
+    browser.refresh_images()
+    app.processEvents()
+    assert browser.current_image_name != name
+    assert name not in browser.list_items
+    assert ImageList(dataset / "annotations.txt").annotations[name] == [(1, 1, 5, 5, 1)]
+
+    # Coming back, it is listed at its natural position with its boxes
+    past = time.time() - 120
+    os.utime(tmp_path / name, (past, past))
+    os.rename(tmp_path / name, dataset / name)
+    browser.refresh_images()
+    assert images.image_annotation_counts[name] == 1
+    annotated = [browser.image_names[browser.annotated_lw.item(i).text()] for i in range(browser.annotated_lw.count())]
+    assert len(annotated) == 3
+    assert annotated == [img_name for img_name, count in images.image_annotation_counts.items() if count is not None]
+    main.hide()
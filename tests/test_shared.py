@@ -0,0 +1,104 @@
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from ayolo.background import ImageList, SharedImageList
+
+
+WORKERS = 4
+IMAGES_PER_WORKER = 12
+
+
+def make_dataset(tmp_path: Path, images: int) -> Path:
+    for i in range(images):
+        (tmp_path / f"img_{i}.png").write_bytes(b"")
+    (tmp_path / "annotations.txt").write_text("")
+    return tmp_path / "annotations.txt"
+
+
+def expected_records(worker: int):
+    records = {}
+    for i in range(IMAGES_PER_WORKER):
+        name = f"img_{worker * IMAGES_PER_WORKER + i}.png"
+        # Every third image is saved then emptied again, the rest keep their last save
+        records[name] = None if i % 3 == 0 else [(i, i, i + 10, i + 10, worker)]
+    return records
+
+
+def annotate(annotation_path: str, worker: int, journal_limit: int):
+    SharedImageList.journal_limit = journal_limit
+    images = SharedImageList(Path(annotation_path))
+    for name, boxes in expected_records(worker).items():
+        images.save(name, [(0, 0, 1, 1, worker)])
+        if boxes is None:
+            images.pop(name)
+        else:
+            images.save(name, boxes)
+
+
+@pytest.mark.parametrize("journal_limit", [SharedImageList.journal_limit, 64])
+def test_concurrent_writers_keep_every_record(tmp_path, journal_limit):
+    annotation_path = make_dataset(tmp_path, WORKERS * IMAGES_PER_WORKER)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=annotate, args=(str(annotation_path), worker, journal_limit)) for worker in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    images = ImageList(annotation_path)
+    for worker in range(WORKERS):
+        for name, boxes in expected_records(worker).items():
+            assert images.annotations.get(name) == boxes
+
+
+def test_sync_reads_only_new_records(tmp_path):
+    annotation_path = make_dataset(tmp_path, 4)
+    first = SharedImageList(annotation_path)
+    second = SharedImageList(annotation_path)
+
+    first.save("img_0.png", [(1, 2, 3, 4, 0)])
+    first.save("img_1.png", [(5, 6, 7, 8, 1)])
+    assert second.sync() == {"img_0.png", "img_1.png"}
+    assert second.annotations["img_1.png"] == [(5, 6, 7, 8, 1)]
+    assert second.sync() == set()
+
+    first.pop("img_0.png")
+    assert second.sync() == {"img_0.png"}
+    assert second.image_annotation_counts["img_0.png"] is None
+
+
+def test_sync_detects_restarted_journal(tmp_path, monkeypatch):
+    annotation_path = make_dataset(tmp_path, 4)
+    first = SharedImageList(annotation_path)
+    second = SharedImageList(annotation_path)
+    monkeypatch.setattr(SharedImageList, "journal_limit", 40)
+
+    # Restart the journal several times while the second session isn't looking, file
+    # identity may be reused so only the generation header tells them apart
+    for i in range(6):
+        first.save(f"img_{i % 4}.png", [(i, i, i + 1, i + 1, 0)])
+
+    assert second.sync() == {"img_0.png", "img_1.png", "img_2.png", "img_3.png"}
+    assert second.annotations == first.annotations
+
+    second.save("img_0.png", [(9, 9, 9, 9, 1)])
+    assert ImageList(annotation_path).annotations == second.annotations
+
+
+def test_remove_after_another_session_removed(tmp_path):
+    annotation_path = make_dataset(tmp_path, 2)
+    first = SharedImageList(annotation_path)
+    second = SharedImageList(annotation_path)
+
+    first.remove("img_0.png")
+    second.remove("img_0.png")
+    assert "img_0.png" not in second.image_names
+    assert not (tmp_path / "img_0.png").exists()
+
+    # The file may also vanish without a journal record
+    (tmp_path / "img_1.png").unlink()
+    second.remove("img_1.png")
+    assert second.image_names == []